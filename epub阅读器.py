@@ -1,17 +1,677 @@
+import time
+START_TIME = time.perf_counter()  # 用于统计启动耗时
+
 import os
+import bisect
+import codecs
+import hashlib
+import json
+import queue
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import zipfile
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from xml.etree import ElementTree
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext, font
 from ttkbootstrap import Style
-from ebooklib import epub
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import textwrap
 import warnings
 
+# 解析相关的重量级模块（ebooklib、lxml）延迟导入，窗口显示后在后台线程预加载
+epub = None
+etree = None
+_parsing_stack_lock = threading.Lock()
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 # 忽略警告
 warnings.filterwarnings("ignore")
 
+LINES_PER_PAGE = 50        # 分页模式每页行数
+SCROLL_WINDOW_LINES = 300  # 连续滚动模式下文本框内保留的行数
+SCROLL_MARGIN_LINES = 50   # 视口距窗口边缘不足该行数时补充/丢弃文本
+SEARCH_BATCH_SECONDS = 0.02  # 每批搜索占用主线程的最长时间
+
+STARTUP_BUDGET_MS = 300   # 窗口应在该时间内显示
+
+APP_DIR = os.path.join(os.path.expanduser('~'), '.epub_reader')
+LIBRARY_DB = os.path.join(APP_DIR, 'library.db')
+FONT_CACHE = os.path.join(APP_DIR, 'fonts.json')
+PERF_LOG = os.path.join(APP_DIR, 'perf.log')
+LIBRARY_BATCH_ROWS = 500  # 书库列表每批插入的行数
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)  # 扫描书库时读取元数据的线程数
+
+LIBRARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS books (
+    path TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL DEFAULT '',
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    chapter INTEGER NOT NULL DEFAULT 0,
+    page INTEGER NOT NULL DEFAULT 0,
+    last_opened REAL
+);
+CREATE TABLE IF NOT EXISTS bookmarks (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    chapter INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    PRIMARY KEY (path, name)
+);
+"""
+
+# 更新元数据时保留已有的阅读位置
+UPSERT_BOOK = """
+INSERT INTO books (path, title, author, size, mtime) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    title = excluded.title, author = excluded.author,
+    size = excluded.size, mtime = excluded.mtime
+"""
+
+# 安装或删除字体时这些目录（含子目录）的修改时间会变化，用于判断字体缓存是否失效
+FONT_DIRS = [
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    os.path.expanduser('~/.fonts'),
+    os.path.expanduser('~/.local/share/fonts'),
+    '/System/Library/Fonts',
+    '/Library/Fonts',
+    os.path.expanduser('~/Library/Fonts'),
+]
+if os.name == 'nt':
+    FONT_DIRS = [os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts')]
+    if os.environ.get('LOCALAPPDATA'):
+        FONT_DIRS.append(os.path.join(os.environ['LOCALAPPDATA'], 'Microsoft', 'Windows', 'Fonts'))
+
+HEADING_TAGS = {'h1', 'h2', 'h3'}
+BLOCK_TAGS = {'p', 'div'}
+SKIP_TAGS = {'script', 'style', 'nav'}
+NEWLINE = re.compile(b'\n')
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+             'param', 'source', 'track', 'wbr'}
+
+# 开始标签会隐式关闭的当前元素，与libxml2（lxml）HTML解析器的行为一致
+_HEADINGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+AUTO_CLOSE = {
+    'p': {'p', 'b', 'i', *_HEADINGS},
+    'div': {'p'},
+    **{h: {'p'} for h in _HEADINGS},
+    'li': {'p', 'li', 'pre', 'dl', 'address', *_HEADINGS},
+    'ul': {'p', 'pre', 'address'},
+    'ol': {'p'},
+    'blockquote': {'p'},
+    'table': {'p', 'a', 'pre', *_HEADINGS},
+    'pre': {'p', 'ul'},
+    'dl': {'p', 'pre', 'dt', 'address'},
+    'dt': {'p', 'pre', 'dd', 'address'},
+    'dd': {'p', 'pre', 'dt', 'address'},
+    'tr': {'p', 'tr', 'td', 'th'},
+    'td': {'p', 'span', 'b', 'a', 'i', 'font', 'td', 'th'},
+    'th': {'p', 'span', 'b', 'a', 'i', 'font', 'td', 'th'},
+    'form': {'p', 'ul', 'ol', 'pre', 'dl', 'form', 'address', *_HEADINGS},
+    'address': {'p', 'ul'},
+    'center': {'p', 'b', 'i', 'font'},
+    'hr': {'p'},
+    'a': {'a'},
+}
+
+# 结束标签的优先级，未列出的为100
+END_PRIORITY = {'div': 150, 'td': 160, 'th': 160, 'tr': 170, 'thead': 180, 'tbody': 180,
+                'tfoot': 180, 'table': 190, 'head': 200, 'body': 200, 'html': 220}
+
+ENCODING_PATTERNS = [
+    re.compile(rb'<\?xml[^>]*encoding\s*=\s*["\']([\w.:-]+)', re.I),
+    re.compile(rb'<meta[^>]*charset\s*=\s*["\']?([\w.:-]+)', re.I),
+]
+# 按浏览器的做法，用超集解码GB系列编码
+ENCODING_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030'}
+
+
+def import_parsing_stack():
+    """导入ebooklib和lxml，可重复调用；后台预加载未完成时会等待其结束"""
+    global epub, etree
+    with _parsing_stack_lock:
+        if epub is None:
+            from ebooklib import epub as epub_module
+            try:
+                from lxml import etree as etree_module
+            except ImportError:
+                etree_module = None
+            etree, epub = etree_module, epub_module
+
+
+def font_dirs_fingerprint():
+    """字体目录及其全部子目录修改时间的摘要
+    
+    Linux的字体通常装在子目录（如/usr/share/fonts/truetype/<包名>/）中，
+    只看顶层目录无法发现变化。这里只遍历目录，不读取字体文件。
+    """
+    digest = hashlib.sha1()
+    for font_dir in FONT_DIRS:
+        for dirpath, _, _ in os.walk(font_dir):
+            try:
+                mtime = os.stat(dirpath).st_mtime
+            except OSError:
+                continue
+            digest.update(f"{dirpath}\0{mtime}\n".encode('utf-8', errors='surrogateescape'))
+    return digest.hexdigest()
+
+
+def load_font_cache():
+    """读取字体缓存，字体目录变化或缓存损坏时返回None"""
+    try:
+        with open(FONT_CACHE, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('fingerprint') != font_dirs_fingerprint():
+        return None
+    return cache.get('fonts')
+
+
+def save_font_cache(fonts):
+    try:
+        os.makedirs(APP_DIR, exist_ok=True)
+        with open(FONT_CACHE, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': font_dirs_fingerprint(), 'fonts': fonts}, f, ensure_ascii=False)
+    except OSError:
+        pass
+
+
+def detect_encoding(content):
+    """按BOM、XML声明、meta标签的顺序确定HTML的编码，缺省UTF-8"""
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'),
+                          (codecs.BOM_UTF16_LE, 'utf-16'),
+                          (codecs.BOM_UTF16_BE, 'utf-16')):
+        if content.startswith(bom):
+            return encoding
+    
+    head = content[:2048]
+    for pattern in ENCODING_PATTERNS:
+        match = pattern.search(head)
+        if match:
+            try:
+                encoding = codecs.lookup(match.group(1).decode('ascii')).name
+            except LookupError:
+                continue
+            return ENCODING_SUPERSETS.get(encoding, encoding)
+    return 'utf-8'
+
+
+def read_epub_metadata(path):
+    """只读取OPF中的标题和作者，不解析正文"""
+    title = os.path.splitext(os.path.basename(path))[0]
+    author = ''
+    try:
+        with zipfile.ZipFile(path) as zf:
+            container = ElementTree.fromstring(zf.read('META-INF/container.xml'))
+            rootfile = container.find('.//{urn:oasis:names:tc:opendocument:xmlns:container}rootfile')
+            opf = ElementTree.fromstring(zf.read(rootfile.get('full-path')))
+            dc = '{http://purl.org/dc/elements/1.1/}'
+            title = opf.findtext(f'.//{dc}title') or title
+            author = opf.findtext(f'.//{dc}creator') or author
+    except Exception:
+        # 损坏、加密或使用不支持压缩方式（如deflate64）的文件按文件名登记，不中断扫描
+        pass
+    return title.strip(), author.strip()
+
+
+class Library:
+    """SQLite书库：记录书籍元数据、阅读位置和书签"""
+    def __init__(self, db_path=LIBRARY_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = self.connect()
+        self.conn.executescript(LIBRARY_SCHEMA)
+    
+    def connect(self):
+        """新建连接，扫描线程使用自己的连接"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+    
+    def close(self):
+        self.conn.close()
+    
+    def folders(self):
+        return [row[0] for row in self.conn.execute('SELECT path FROM folders ORDER BY path')]
+    
+    def add_folder(self, folder):
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO folders (path) VALUES (?)',
+                              (os.path.abspath(folder),))
+    
+    def books(self):
+        """返回 (路径, 标题, 作者, 章节) 列表，最近阅读的在前"""
+        return self.conn.execute(
+            'SELECT path, title, author, chapter FROM books '
+            'ORDER BY last_opened IS NULL, last_opened DESC, title'
+        ).fetchall()
+    
+    def add_book(self, path):
+        """登记单个文件，未变化时不重新读取元数据"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.conn.execute('SELECT size, mtime FROM books WHERE path = ?', (path,)).fetchone()
+        if row != (st.st_size, st.st_mtime):
+            with self.conn:
+                self.conn.execute(UPSERT_BOOK, (path, *read_epub_metadata(path), st.st_size, st.st_mtime))
+        return path
+    
+    def get_position(self, path):
+        row = self.conn.execute('SELECT chapter, page FROM books WHERE path = ?', (path,)).fetchone()
+        return row if row else (0, 0)
+    
+    def save_position(self, path, chapter, page):
+        with self.conn:
+            self.conn.execute(
+                'UPDATE books SET chapter = ?, page = ?, last_opened = ? WHERE path = ?',
+                (chapter, page, time.time(), path)
+            )
+    
+    def get_bookmarks(self, path):
+        rows = self.conn.execute('SELECT name, chapter, page FROM bookmarks WHERE path = ?', (path,))
+        return {name: (chapter, page) for name, chapter, page in rows}
+    
+    def set_bookmark(self, path, name, chapter, page):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO bookmarks (path, name, chapter, page) VALUES (?, ?, ?, ?)',
+                (path, name, chapter, page)
+            )
+    
+    def delete_bookmark(self, path, name):
+        with self.conn:
+            self.conn.execute('DELETE FROM bookmarks WHERE path = ? AND name = ?', (path, name))
+    
+    def scan(self, folders):
+        """增量扫描文件夹（可在后台线程调用）
+        
+        只重新读取新增或大小/修改时间变化的文件，元数据由线程池并行读取；
+        文件夹下已不存在的书籍从列表中删除，书签保留，文件恢复后仍可使用。
+        不存在（如未挂载）的文件夹不做删除。返回 (更新数, 删除数)。
+        """
+        conn = self.connect()
+        try:
+            known = {path: (size, mtime) for path, size, mtime in
+                     conn.execute('SELECT path, size, mtime FROM books')}
+            
+            found = {}
+            for folder in folders:
+                for dirpath, _, filenames in os.walk(folder):
+                    for name in filenames:
+                        if not name.lower().endswith('.epub'):
+                            continue
+                        path = os.path.join(dirpath, name)
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        found[path] = (st.st_size, st.st_mtime)
+            
+            changed = [path for path, stat in found.items() if known.get(path) != stat]
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+                metadata = list(pool.map(read_epub_metadata, changed))
+            
+            prefixes = tuple(os.path.join(folder, '') for folder in folders if os.path.isdir(folder))
+            removed = [(path,) for path in known if path not in found and path.startswith(prefixes)]
+            
+            with conn:
+                conn.executemany(UPSERT_BOOK, [
+                    (path, title, author, *found[path])
+                    for path, (title, author) in zip(changed, metadata)
+                ])
+                conn.executemany('DELETE FROM books WHERE path = ?', removed)
+            return len(changed), len(removed)
+        finally:
+            conn.close()
+
+
+class ChapterTextSink:
+    """HTML解析事件接收器：单次遍历，只输出叶子块级元素的文本
+    
+    进入或离开块级元素时输出已累积的文本，嵌套的div/p不会被重复提取；
+    块级元素开始时会结束未闭合的标题。事件接口与lxml的解析target一致，
+    标准库HTMLParser经StreamingHTMLParser修正后也通过它驱动。
+    """
+    def __init__(self):
+        self.paragraphs = []
+        self.buffer = []
+        self.block_depth = 0
+        self.skip_depth = 0
+        self.heading = None
+    
+    def start(self, tag, attrib=None):
+        tag = tag.rsplit('}', 1)[-1].lower()
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        
+        if tag in HEADING_TAGS or tag in BLOCK_TAGS:
+            self.flush(heading=self.heading is not None)
+            self.heading = None
+            if tag in HEADING_TAGS:
+                self.heading = tag
+            else:
+                self.block_depth += 1
+    
+    def end(self, tag):
+        tag = tag.rsplit('}', 1)[-1].lower()
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+            return
+        if self.skip_depth:
+            return
+        
+        if self.heading:
+            if tag == self.heading:
+                self.flush(heading=True)
+                self.heading = None
+        elif tag in BLOCK_TAGS:
+            self.flush()
+            self.block_depth = max(0, self.block_depth - 1)
+    
+    def data(self, data):
+        if not self.skip_depth and (self.heading or self.block_depth):
+            self.buffer.append(data)
+    
+    def flush(self, heading=False):
+        content = ''.join(self.buffer).strip()
+        self.buffer = []
+        if content:
+            self.paragraphs.append(f"\n【{content}】\n" if heading else content)
+    
+    def close(self):
+        self.flush(heading=self.heading is not None)
+        return '\n'.join(self.paragraphs)
+
+
+class StreamingHTMLParser(HTMLParser):
+    """把标准库HTMLParser的回调转发给ChapterTextSink（无lxml时使用）
+    
+    标准库不修正不规范的标签，这里维护元素栈，按libxml2的规则隐式关闭元素、
+    忽略多余的结束标签，使接收器收到与lxml相同的成对事件。
+    """
+    def __init__(self, sink):
+        super().__init__()
+        self.sink = sink
+        self.stack = []
+    
+    def handle_starttag(self, tag, attrs):
+        closes = AUTO_CLOSE.get(tag, ())
+        while self.stack and self.stack[-1] in closes:
+            self.sink.end(self.stack.pop())
+        
+        self.sink.start(tag)
+        if tag in VOID_TAGS:
+            self.sink.end(tag)
+        else:
+            self.stack.append(tag)
+    
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if tag not in self.stack:
+            return
+        # 结束标签只能隐式关闭优先级不高于自身的元素，否则被忽略
+        priority = END_PRIORITY.get(tag, 100)
+        index = len(self.stack) - 1 - self.stack[::-1].index(tag)
+        if any(END_PRIORITY.get(name, 100) > priority for name in self.stack[index+1:]):
+            return
+        while self.stack:
+            name = self.stack.pop()
+            self.sink.end(name)
+            if name == tag:
+                break
+    
+    def handle_data(self, data):
+        self.sink.data(data)
+    
+    def close(self):
+        super().close()
+        while self.stack:
+            self.sink.end(self.stack.pop())
+
+
+def extract_chapter_text(content, parser=None):
+    """从章节HTML中提取正文，parser可选'lxml'或'html.parser'，默认优先lxml
+    
+    调用前需先执行import_parsing_stack()。
+    """
+    if not content:
+        return ''
+    if parser is None:
+        parser = 'lxml' if etree is not None else 'html.parser'
+    
+    # 两种解析器都使用按声明编码解码后的文本，保证输出一致
+    if isinstance(content, bytes):
+        content = content.decode(detect_encoding(content), errors='replace')
+    
+    sink = ChapterTextSink()
+    if parser == 'lxml':
+        html_parser = etree.HTMLParser(target=sink)
+        html_parser.feed(content)
+        return html_parser.close()
+    
+    html_parser = StreamingHTMLParser(sink)
+    html_parser.feed(content)
+    html_parser.close()
+    return sink.close()
+
+
+def legacy_extract_chapter_text(content):
+    """原先的BeautifulSoup + find_all提取方式，仅作为基准测试的对照"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    for elem in soup(['script', 'style', 'nav']):
+        elem.decompose()
+    
+    text = []
+    for tag in soup.find_all(['h1', 'h2', 'h3', 'p', 'div']):
+        content = tag.get_text().strip()
+        if content:
+            if tag.name in ['h1', 'h2', 'h3']:
+                text.append(f"\n【{content}】\n")
+            else:
+                text.append(content)
+    return '\n'.join(text)
+
+
+def benchmark_extraction(epub_paths=None, repeat=3):
+    """比较各提取方式的耗时，并检查新解析器之间输出是否一致
+    
+    未指定EPUB时生成一组带嵌套div/p的合成语料。安装了bs4时以原先的
+    BeautifulSoup提取为基准，否则以html.parser为基准。
+    """
+    import_parsing_stack()
+    extractors = {}
+    try:
+        import bs4  # noqa: F401
+        extractors['bs4(原)'] = legacy_extract_chapter_text
+    except ImportError:
+        pass
+    extractors['html.parser'] = lambda doc: extract_chapter_text(doc, 'html.parser')
+    if etree is not None:
+        extractors['lxml'] = lambda doc: extract_chapter_text(doc, 'lxml')
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        if not epub_paths:
+            epub_paths = []
+            for size in (0.5, 2):
+                path = os.path.join(tmp, f'nested_{size}MB.epub')
+                write_synthetic_epub(path, size, nested=True)
+                epub_paths.append(path)
+        
+        for path in epub_paths:
+            book = epub.read_epub(path)
+            docs = [item.get_content() for item in book.get_items()
+                    if isinstance(item, epub.EpubHtml)]
+            
+            results = {}
+            for name, extract in extractors.items():
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    texts = [extract(doc) for doc in docs]
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results[name] = (best, texts)
+            
+            base_time = next(iter(results.values()))[0]
+            new_texts = results['html.parser'][1]
+            print(f"{os.path.basename(path)}: {len(docs)}个文档")
+            for name, (elapsed, texts) in results.items():
+                if extractors[name] is legacy_extract_chapter_text:
+                    note = "（含重复文本）"
+                else:
+                    note = "输出一致" if texts == new_texts else "输出不一致"
+                print(f"  {name:<12} {elapsed*1000:8.1f} ms  加速 {base_time/elapsed:5.2f}x  "
+                      f"{sum(map(len, texts))}字符 {note}")
+
+
+class ChapterStore:
+    """紧凑的章节存储：全部章节以UTF-8连续存放在同一个bytearray中
+    
+    offsets[i]:offsets[i+1] 是第i章的字节区间。翻页和连续滚动时只解码
+    需要显示的行，每行起始字节偏移按章节首次访问时计算并缓存，分页、
+    搜索跳转都以它为准。
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('Q', [0])
+        self.line_counts = array('L')
+        self.line_starts = {}  # 章节索引 -> 每行首字节偏移
+    
+    def append(self, text):
+        data = text.encode('utf-8')
+        self.buffer += data
+        self.offsets.append(len(self.buffer))
+        self.line_counts.append(data.count(b'\n') + 1)
+    
+    def __len__(self):
+        return len(self.line_counts)
+    
+    def __getitem__(self, i):
+        """解码整章（搜索、连续滚动时使用）"""
+        return self.buffer[self.offsets[i]:self.offsets[i+1]].decode('utf-8')
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    @property
+    def nbytes(self):
+        return len(self.buffer) + self.offsets.itemsize * len(self.offsets)
+    
+    def page_count(self, i):
+        return self.line_counts[i] // LINES_PER_PAGE + 1
+    
+    def preview(self, i, length):
+        """章节开头的若干字符，只解码需要的字节"""
+        start = self.offsets[i]
+        end = min(self.offsets[i+1], start + length * 4)
+        return self.buffer[start:end].decode('utf-8', errors='ignore')[:length]
+    
+    def get_line_starts(self, i):
+        """第i章每行首字节在缓冲区中的偏移，首次访问时计算并缓存"""
+        starts = self.line_starts.get(i)
+        if starts is None:
+            # '\n'不会出现在UTF-8多字节字符中，可直接在字节上查找
+            starts = array('Q', [self.offsets[i]])
+            starts.extend(m.end() for m in NEWLINE.finditer(self.buffer, self.offsets[i], self.offsets[i+1]))
+            self.line_starts[i] = starts
+        return starts
+    
+    def lines_text(self, i, start, end):
+        """解码第i章[start, end)行的文本"""
+        starts = self.get_line_starts(i)
+        if start >= min(end, len(starts)):
+            return ''
+        stop = starts[end] - 1 if end < len(starts) else self.offsets[i+1]
+        return self.buffer[starts[start]:stop].decode('utf-8')
+    
+    def page_for_offset(self, i, offset):
+        """章内字节偏移offset所在的页码"""
+        line = bisect.bisect_right(self.get_line_starts(i), self.offsets[i] + offset) - 1
+        return line // LINES_PER_PAGE
+    
+    def page_text(self, i, page):
+        """解码第i章第page页的文本"""
+        return self.lines_text(i, page * LINES_PER_PAGE, (page + 1) * LINES_PER_PAGE)
+
+
+def peak_rss_kb():
+    """进程内存峰值(KB)，不支持的平台返回None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class PerfLog:
+    """性能统计：记录解析、分页、渲染、搜索耗时，开启后以JSON行追加到日志文件"""
+    def __init__(self, path=PERF_LOG):
+        self.path = path
+        self.enabled = False
+        self.listener = None
+        self.last = {}
+        self.totals = defaultdict(lambda: [0, 0.0])  # 事件 -> [次数, 总耗时ms]
+    
+    @contextmanager
+    def measure(self, event, **fields):
+        """统计代码块耗时，调用方可向返回的字典补充日志字段"""
+        start = time.perf_counter()
+        yield fields
+        self.record(event, time.perf_counter() - start, **fields)
+    
+    def record(self, event, seconds, **fields):
+        ms = seconds * 1000
+        self.last[event] = ms
+        total = self.totals[event]
+        total[0] += 1
+        total[1] += ms
+        
+        if self.enabled:
+            entry = {'ts': round(time.time(), 3), 'event': event, 'ms': round(ms, 3),
+                     'peak_rss_kb': peak_rss_kb(), **fields}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            except OSError:
+                pass
+        
+        if self.listener:
+            self.listener()
+    
+    def average(self, event):
+        count, total = self.totals.get(event, (0, 0.0))
+        return total / count if count else None
+    
+    def reset(self):
+        self.last.clear()
+        self.totals.clear()
+
+
 class ModernEPubReader:
-    def __init__(self, root):
+    def __init__(self, root, library=None):
         self.root = root
         self.style = Style(theme='litera')
         self.root.title("Modern EPUB Reader")
@@ -19,12 +679,37 @@ class ModernEPubReader:
         
         # 初始化变量
         self.book = None
-        self.chapters = []
+        self.chapters = ChapterStore()
         self.current_chapter = 0
         self.current_page = 0
         self.bookmarks = {}
         self.search_results = []
         
+        # 流式搜索状态：新搜索递增search_token使旧批次失效
+        self.search_token = 0
+        self.search_job = None
+        self.search_matches = None
+        self.result_window = None
+        
+        # 书库：当前书籍路径及后台扫描状态
+        self.library = library if library is not None else Library()
+        self.book_path = None
+        self.scan_thread = None
+        self.scan_queue = queue.Queue()
+        self.library_window = None
+        self.library_fill_token = 0
+        
+        self.available_fonts = None  # 本次运行内的字体列表缓存
+        self.startup_reported = False
+        self.perf = PerfLog()
+        self.search_started = 0.0
+        self.search_keyword = ''
+        
+        # 连续滚动模式状态：当前章节的行数及文本框中保留的行区间
+        self.scroll_total = 0
+        self.window_start = 0
+        self.window_end = 0
+        
         # 显示设置
         self.settings = {
             'font_family': 'Microsoft YaHei',
@@ -32,11 +717,16 @@ class ModernEPubReader:
             'line_spacing': 2,
             'paragraph_spacing': 10,
             'indent': 2,  # 首行缩进字符数
-            'theme': 'litera'
+            'theme': 'litera',
+            'scroll_mode': 'page'  # 'page' 分页 / 'scroll' 连续滚动
         }
         
         # 创建UI
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.bind('<Map>', self.on_first_map, add='+')
+        self.root.bind('<F12>', lambda e: self.toggle_perf())
+        self.perf.listener = self.update_perf_overlay
         
         # Windows系统启用DPI感知
         if os.name == 'nt':
@@ -46,6 +736,27 @@ class ModernEPubReader:
             except:
                 pass
         
+    def on_first_map(self, event):
+        """窗口首次显示：报告启动耗时，并在后台预加载解析模块"""
+        if event.widget is not self.root or self.startup_reported:
+            return
+        self.startup_reported = True
+        
+        elapsed = (time.perf_counter() - START_TIME) * 1000
+        note = f"（超过{STARTUP_BUDGET_MS} ms）" if elapsed > STARTUP_BUDGET_MS else ""
+        print(f"窗口显示耗时: {elapsed:.0f} ms{note}", file=sys.stderr)
+        threading.Thread(target=self.preload_parsing_stack, daemon=True).start()
+    
+    def preload_parsing_stack(self):
+        """后台导入解析模块，首次打开文件时无需再等待"""
+        start = time.perf_counter()
+        try:
+            import_parsing_stack()
+        except ImportError as e:
+            print(f"解析模块加载失败: {e}", file=sys.stderr)
+            return
+        print(f"解析模块后台加载耗时: {(time.perf_counter()-start)*1000:.0f} ms", file=sys.stderr)
+    
     def create_widgets(self):
         """创建界面组件"""
         # 顶部工具栏
@@ -53,10 +764,13 @@ class ModernEPubReader:
         toolbar.pack(fill=tk.X, padx=5, pady=5)
         
         ttk.Button(toolbar, text="打开", command=self.open_file).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="书库", command=self.show_library).pack(side=tk.LEFT, padx=2)
         ttk.Button(toolbar, text="目录", command=self.show_toc).pack(side=tk.LEFT, padx=2)
         ttk.Button(toolbar, text="书签", command=self.manage_bookmarks).pack(side=tk.LEFT, padx=2)
         ttk.Button(toolbar, text="搜索", command=self.show_search).pack(side=tk.LEFT, padx=2)
         ttk.Button(toolbar, text="设置", command=self.show_settings).pack(side=tk.LEFT, padx=2)
+        self.mode_button = ttk.Button(toolbar, text="滚动", command=self.toggle_scroll_mode)
+        self.mode_button.pack(side=tk.LEFT, padx=2)
         
         # 搜索框（默认隐藏）
         self.search_frame = ttk.Frame(self.root)
@@ -82,6 +796,15 @@ class ModernEPubReader:
         self.text_area.pack(fill=tk.BOTH, expand=True)
         self.text_area.config(state=tk.DISABLED)
         
+        # 性能浮层（F12切换，默认隐藏）
+        self.perf_label = tk.Label(
+            self.text_area,
+            justify=tk.LEFT,
+            bg='#ffffe0',
+            fg='#333333',
+            font=('Courier New', 10)
+        )
+        
         # 底部状态栏
         status_bar = ttk.Frame(self.root)
         status_bar.pack(fill=tk.X, padx=5, pady=5)
@@ -124,40 +847,169 @@ class ModernEPubReader:
         )
         
         if file_path:
+            self.open_book(file_path)
+    
+    def open_book(self, file_path):
+        """打开书籍并恢复上次的阅读位置和书签"""
+        try:
+            self.save_position()
+            self.load_epub(file_path)
+            # 加载成功后才登记并切换，失败的文件不进入书库，原书的位置和书签仍会保存；
+            # 此时原书已被替换，登记失败也不能再把位置写回原书
+            self.book_path = None
+            self.book_path = self.library.add_book(file_path)
+            chapter, page = self.library.get_position(self.book_path)
+            # 文件更新后章节可能变短，超出范围的位置要收回
+            if chapter < len(self.chapters):
+                self.current_chapter = chapter
+                self.current_page = min(page, self.chapters.page_count(chapter) - 1)
+            self.bookmarks = self.library.get_bookmarks(self.book_path)
+            self.display_chapter()
+        except Exception as e:
+            messagebox.showerror("错误", f"无法加载文件:\n{str(e)}")
+    
+    def save_position(self):
+        """保存当前书籍的阅读位置"""
+        if self.book_path:
+            self.library.save_position(self.book_path, self.current_chapter, self.current_page)
+    
+    def on_close(self):
+        """退出前保存阅读位置"""
+        self.cancel_search()
+        self.save_position()
+        self.library.close()
+        self.root.destroy()
+    
+    def show_library(self):
+        """显示书库"""
+        if self.library_window is not None and self.library_window.winfo_exists():
+            self.library_window.lift()
+            return
+        
+        lib_window = tk.Toplevel(self.root)
+        lib_window.title("书库")
+        lib_window.geometry("800x500")
+        self.library_window = lib_window
+        
+        self.library_status = ttk.Label(lib_window)
+        self.library_status.pack(fill=tk.X, padx=5, pady=5)
+        
+        tree = ttk.Treeview(lib_window, columns=('title', 'author', 'progress'), show='headings')
+        tree.heading('title', text='书名')
+        tree.heading('author', text='作者')
+        tree.heading('progress', text='进度')
+        tree.column('title', width=420)
+        tree.column('author', width=200)
+        tree.column('progress', width=120)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.library_tree = tree
+        self.refresh_library()
+        
+        def open_selected():
+            selection = tree.selection()
+            if selection:
+                lib_window.destroy()
+                self.open_book(selection[0])
+        
+        def add_folder():
+            folder = filedialog.askdirectory(title="选择书库文件夹", parent=lib_window)
+            if folder:
+                self.library.add_folder(folder)
+                self.start_library_scan()
+        
+        tree.bind('<Double-Button-1>', lambda e: open_selected())
+        
+        btn_frame = ttk.Frame(lib_window)
+        btn_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Button(btn_frame, text="打开", command=open_selected).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="添加文件夹", command=add_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="扫描", command=self.start_library_scan).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="关闭", command=lib_window.destroy).pack(side=tk.RIGHT)
+    
+    def refresh_library(self, note=''):
+        """从数据库重新填充书库列表"""
+        if self.library_window is None or not self.library_window.winfo_exists():
+            return
+        rows = self.library.books()
+        self.library_status.config(text=f"共{len(rows)}本{note}")
+        
+        tree = self.library_tree
+        tree.delete(*tree.get_children())
+        self.library_fill_token += 1
+        self.fill_library_batch(rows, 0, self.library_fill_token)
+    
+    def fill_library_batch(self, rows, start, token):
+        """分批插入书库行，避免书籍很多时界面卡顿"""
+        if token != self.library_fill_token or not self.library_window.winfo_exists():
+            return
+        
+        end = min(len(rows), start + LIBRARY_BATCH_ROWS)
+        for path, title, author, chapter in rows[start:end]:
+            self.library_tree.insert('', tk.END, iid=path, values=(title, author, f"第{chapter+1}章"))
+        if end < len(rows):
+            self.root.after(1, self.fill_library_batch, rows, end, token)
+    
+    def start_library_scan(self):
+        """在后台线程增量扫描所有书库文件夹"""
+        if self.scan_thread is not None and self.scan_thread.is_alive():
+            return
+        
+        folders = self.library.folders()
+        if not folders:
+            messagebox.showinfo("提示", "请先添加书库文件夹")
+            return
+        
+        def worker():
             try:
-                self.load_epub(file_path)
-                self.display_chapter()
+                self.scan_queue.put(self.library.scan(folders))
             except Exception as e:
-                messagebox.showerror("错误", f"无法加载文件:\n{str(e)}")
+                self.scan_queue.put(e)
+        
+        self.scan_thread = threading.Thread(target=worker, daemon=True)
+        self.scan_thread.start()
+        if self.library_window is not None and self.library_window.winfo_exists():
+            self.library_status.config(text="扫描中...")
+        self.root.after(100, self.poll_library_scan)
+    
+    def poll_library_scan(self):
+        """轮询扫描结果（Tk控件只能在主线程更新）"""
+        try:
+            result = self.scan_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_library_scan)
+            return
+        
+        if isinstance(result, Exception):
+            messagebox.showerror("错误", f"扫描书库失败:\n{str(result)}")
+            return
+        
+        if self.library_window is not None and self.library_window.winfo_exists():
+            changed, removed = result
+            self.refresh_library(f"，更新{changed}本，移除{removed}本")
     
     def load_epub(self, epub_path):
         """加载并解析EPUB文件"""
-        self.book = epub.read_epub(epub_path)
-        self.chapters = []
-        
-        # 提取章节内容
-        for item in self.book.get_items():
-            if isinstance(item, epub.EpubHtml):
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
-                
-                # 清理不需要的元素
-                for elem in soup(['script', 'style', 'nav']):
-                    elem.decompose()
-                
-                # 提取文本
-                text = []
-                for tag in soup.find_all(['h1', 'h2', 'h3', 'p', 'div']):
-                    content = tag.get_text().strip()
-                    if content:
-                        if tag.name in ['h1', 'h2', 'h3']:
-                            text.append(f"\n【{content}】\n")
-                        else:
-                            text.append(content)
-                
-                chapter_text = '\n'.join(text)
-                if chapter_text.strip():
-                    self.chapters.append(chapter_text)
+        self.cancel_search()
+        import_parsing_stack()
+        with self.perf.measure('parse', file=os.path.basename(epub_path)) as fields:
+            book = epub.read_epub(epub_path)
+            chapters = ChapterStore()
+            
+            # 提取章节内容
+            for item in book.get_items():
+                if isinstance(item, epub.EpubHtml):
+                    chapter_text = extract_chapter_text(item.get_content())
+                    if chapter_text.strip():
+                        chapters.append(chapter_text)
+            
+            fields['chapters'] = len(chapters)
+            fields['bytes'] = chapters.nbytes
         
+        # 解析全部成功后再替换，失败时保留当前书籍
+        self.close_search_results()
+        self.book = book
+        self.chapters = chapters
         self.current_chapter = 0
         self.current_page = 0
         self.update_status()
@@ -166,29 +1018,159 @@ class ModernEPubReader:
         """显示当前章节"""
         if not self.chapters:
             return
-            
-        # 计算分页
-        chapter_text = self.chapters[self.current_chapter]
-        formatted_text = self.apply_text_formatting(chapter_text)
-        lines = formatted_text.split('\n')
-        lines_per_page = 50  # 每页行数
         
-        total_pages = (len(lines) // lines_per_page) + 1
-        start = self.current_page * lines_per_page
-        end = start + lines_per_page
+        if self.settings['scroll_mode'] == 'scroll':
+            self.display_chapter_scroll()
+            return
+            
+        # 只解码当前页
+        with self.perf.measure('paginate', chapter=self.current_chapter, page=self.current_page):
+            page_text = self.chapters.page_text(self.current_chapter, self.current_page)
         
         # 显示文本
+        with self.perf.measure('render', chapter=self.current_chapter, page=self.current_page):
+            self.text_area.config(state=tk.NORMAL)
+            self.text_area.delete(1.0, tk.END)
+            self.text_area.insert(tk.END, self.apply_text_formatting(page_text))
+            self.text_area.config(state=tk.DISABLED)
+        
+        self.update_status()
+    
+    def toggle_perf(self):
+        """切换性能浮层和结构化日志"""
+        self.perf.enabled = not self.perf.enabled
+        if self.perf.enabled:
+            self.perf_label.place(relx=1.0, rely=0.0, anchor='ne')
+            self.update_perf_overlay()
+        else:
+            self.perf_label.place_forget()
+    
+    def update_perf_overlay(self):
+        """刷新性能浮层：各阶段最近一次耗时及内存"""
+        if not self.perf.enabled:
+            return
+        
+        names = [('parse', '解析'), ('paginate', '分页'), ('render', '渲染'), ('search', '搜索')]
+        timings = ' | '.join(
+            f"{label} {self.perf.last[event]:.1f} ms" if event in self.perf.last else f"{label} -"
+            for event, label in names
+        )
+        rss = peak_rss_kb()
+        memory = f"章节缓冲 {self.chapters.nbytes / 1048576:.1f} MB"
+        if rss is not None:
+            memory += f" | 峰值内存 {rss / 1024:.0f} MB"
+        self.perf_label.config(text=f"{timings}\n{memory}")
+    
+    def toggle_scroll_mode(self):
+        """切换分页/连续滚动阅读模式"""
+        scroll = self.settings['scroll_mode'] != 'scroll'
+        self.settings['scroll_mode'] = 'scroll' if scroll else 'page'
+        
+        if scroll:
+            # 滚动条改为按整章比例显示的虚拟滚动条
+            self.text_area.config(yscrollcommand=self.on_text_yscroll)
+            self.text_area.vbar.config(command=self.on_virtual_scroll)
+        else:
+            self.text_area.config(yscrollcommand=self.text_area.vbar.set)
+            self.text_area.vbar.config(command=self.text_area.yview)
+            self.scroll_total = 0
+            self.window_start = self.window_end = 0
+        
+        self.mode_button.config(text="分页" if scroll else "滚动")
+        self.display_chapter()
+    
+    def display_chapter_scroll(self):
+        """以连续滚动模式显示当前章节，从当前页首行开始"""
+        with self.perf.measure('paginate', chapter=self.current_chapter, mode='scroll'):
+            # 只建立行偏移，文本在滑动窗口时按需解码
+            self.chapters.get_line_starts(self.current_chapter)
+            self.scroll_total = self.chapters.line_counts[self.current_chapter]
+        
         self.text_area.config(state=tk.NORMAL)
         self.text_area.delete(1.0, tk.END)
-        self.text_area.insert(tk.END, '\n'.join(lines[start:end]))
         self.text_area.config(state=tk.DISABLED)
+        self.window_start = self.window_end = 0
         
+        self.load_scroll_window(self.current_page * LINES_PER_PAGE)
         self.update_status()
     
+    def load_scroll_window(self, top_line):
+        """移动文本窗口，使第top_line行位于视口顶部附近，只增删差异部分"""
+        total = self.scroll_total
+        top_line = max(0, min(top_line, total - 1))
+        new_start = max(0, top_line - SCROLL_WINDOW_LINES // 2)
+        new_end = min(total, new_start + SCROLL_WINDOW_LINES)
+        new_start = max(0, new_end - SCROLL_WINDOW_LINES)
+        old_start, old_end = self.window_start, self.window_end
+        
+        with self.perf.measure('render', chapter=self.current_chapter, mode='scroll'):
+            self.slide_scroll_window(old_start, old_end, new_start, new_end)
+        
+        self.window_start, self.window_end = new_start, new_end
+        self.text_area.yview(f'{top_line - new_start + 1}.0')
+    
+    def scroll_text(self, start, end):
+        """解码并格式化当前章节[start, end)行"""
+        return self.apply_text_formatting(self.chapters.lines_text(self.current_chapter, start, end))
+    
+    def slide_scroll_window(self, old_start, old_end, new_start, new_end):
+        """把文本框内容从[old_start, old_end)行调整为[new_start, new_end)行"""
+        text = self.text_area
+        text.config(state=tk.NORMAL)
+        if new_start >= old_end or new_end <= old_start:
+            # 与当前窗口无重叠，整体替换
+            text.delete(1.0, tk.END)
+            text.insert(tk.END, self.scroll_text(new_start, new_end))
+        else:
+            # 先处理尾部（行号仍以old_start为基准），再处理头部
+            if new_end > old_end:
+                text.insert('end-1c', '\n' + self.scroll_text(old_end, new_end))
+            elif new_end < old_end:
+                text.delete(f'{new_end - old_start}.end', tk.END)
+            
+            if new_start > old_start:
+                text.delete(1.0, f'{new_start - old_start + 1}.0')
+            elif new_start < old_start:
+                text.insert(1.0, self.scroll_text(new_start, old_start) + '\n')
+        text.config(state=tk.DISABLED)
+    
+    def visible_line_range(self):
+        """返回视口内首尾行在整章中的行号"""
+        text = self.text_area
+        top = int(text.index('@0,0').split('.')[0]) - 1
+        bottom = int(text.index(f'@0,{text.winfo_height()}').split('.')[0]) - 1
+        return self.window_start + top, self.window_start + bottom
+    
+    def on_text_yscroll(self, first, last):
+        """文本框滚动回调：按需滑动文本窗口并更新虚拟滚动条"""
+        if not self.scroll_total:
+            return
+        
+        total = self.scroll_total
+        top, bottom = self.visible_line_range()
+        if ((bottom >= self.window_end - SCROLL_MARGIN_LINES and self.window_end < total) or
+                (top < self.window_start + SCROLL_MARGIN_LINES and self.window_start > 0)):
+            self.load_scroll_window(top)
+        
+        self.text_area.vbar.set(top / total, min(1.0, (bottom + 1) / total))
+        self.current_page = top // LINES_PER_PAGE
+        self.update_status()
+    
+    def on_virtual_scroll(self, *args):
+        """虚拟滚动条回调：拖动时按整章比例定位"""
+        if not self.scroll_total:
+            return
+        
+        if args[0] == 'moveto':
+            self.load_scroll_window(int(float(args[1]) * self.scroll_total))
+        else:
+            # 按行/按页滚动交给文本框处理，窗口滑动由on_text_yscroll完成
+            self.text_area.yview(*args)
+    
     def update_status(self):
         """更新状态栏"""
         total_chapters = len(self.chapters) if self.chapters else 0
-        total_pages = (len(self.chapters[self.current_chapter].split('\n')) // 50) + 1 if self.chapters else 0
+        total_pages = self.chapters.page_count(self.current_chapter) if self.chapters else 0
         
         self.chapter_label.config(text=f"章节: {self.current_chapter+1}/{total_chapters}")
         self.page_label.config(text=f"页码: {self.current_page+1}/{total_pages}")
@@ -197,9 +1179,21 @@ class ModernEPubReader:
         """下一页"""
         if not self.chapters:
             return
+        
+        if self.settings['scroll_mode'] == 'scroll':
+            # 章内先滚动，到达章末再切换章节
+            if self.window_end < self.scroll_total or self.text_area.yview()[1] < 1.0:
+                self.text_area.yview_scroll(1, 'pages')
+                return
+            if self.current_chapter < len(self.chapters) - 1:
+                self.current_chapter += 1
+                self.current_page = 0
+                self.display_chapter()
+            else:
+                messagebox.showinfo("提示", "已经是最后一页了")
+            return
             
-        lines = self.chapters[self.current_chapter].split('\n')
-        total_pages = (len(lines) // 50) + 1
+        total_pages = self.chapters.page_count(self.current_chapter)
         
         if self.current_page < total_pages - 1:
             self.current_page += 1
@@ -215,14 +1209,19 @@ class ModernEPubReader:
         """上一页"""
         if not self.chapters:
             return
+        
+        if self.settings['scroll_mode'] == 'scroll':
+            # 章内先滚动，到达章首再切换到上一章末尾
+            if self.window_start > 0 or self.text_area.yview()[0] > 0.0:
+                self.text_area.yview_scroll(-1, 'pages')
+                return
+            self.current_page = 0
             
         if self.current_page > 0:
             self.current_page -= 1
         elif self.current_chapter > 0:
             self.current_chapter -= 1
-            lines = self.chapters[self.current_chapter].split('\n')
-            total_pages = (len(lines) // 50) + 1
-            self.current_page = total_pages - 1
+            self.current_page = self.chapters.page_count(self.current_chapter) - 1
         else:
             messagebox.showinfo("提示", "已经是第一页了")
         
@@ -247,8 +1246,8 @@ class ModernEPubReader:
             font=(self.settings['font_family'], self.settings['font_size'])
         )
         
-        for i, chapter in enumerate(self.chapters):
-            preview = chapter[:50].replace('\n', ' ')
+        for i in range(len(self.chapters)):
+            preview = self.chapters.preview(i, 50).replace('\n', ' ')
             listbox.insert(tk.END, f"第{i+1}章: {preview}...")
         
         listbox.pack(fill=tk.BOTH, expand=True)
@@ -305,6 +1304,8 @@ class ModernEPubReader:
             name = entry.get().strip()
             if name:
                 self.bookmarks[name] = (self.current_chapter, self.current_page)
+                if self.book_path:
+                    self.library.set_bookmark(self.book_path, name, self.current_chapter, self.current_page)
                 dialog.destroy()
                 if parent:
                     parent.destroy()
@@ -335,6 +1336,8 @@ class ModernEPubReader:
             name = list(listbox.get(selection[0]).split())[0]
             if name in self.bookmarks:
                 del self.bookmarks[name]
+                if self.book_path:
+                    self.library.delete_bookmark(self.book_path, name)
                 parent.destroy()
                 self.manage_bookmarks()
     
@@ -348,66 +1351,135 @@ class ModernEPubReader:
         self.search_frame.pack_forget()
     
     def do_search(self):
-        """执行搜索"""
+        """执行搜索：取消进行中的搜索，结果分批流式加入列表"""
         keyword = self.search_entry.get().strip()
         if not keyword:
             messagebox.showwarning("警告", "请输入搜索关键词")
             return
-            
+        
+        self.cancel_search()
+        self.search_results = []
+        self.search_keyword = keyword
+        self.search_started = time.perf_counter()
+        self.show_search_results()
+        self.search_matches = self.iter_search_matches(keyword.lower())
+        self.search_batch(self.search_token)
+    
+    def cancel_search(self):
+        """取消进行中的搜索"""
+        self.search_token += 1
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        if self.search_matches is not None and self.result_window is not None \
+                and self.result_window.winfo_exists():
+            self.result_status.config(text=f"搜索已取消，已找到{len(self.search_results)}条")
+        self.search_matches = None
+    
+    def close_search_results(self):
+        """关闭搜索结果窗口并清空结果（换书后旧结果的章节和偏移已失效）"""
+        self.cancel_search()
+        if self.result_window is not None and self.result_window.winfo_exists():
+            self.result_window.destroy()
+        self.result_window = None
         self.search_results = []
+    
+    def iter_search_matches(self, keyword):
+        """逐个产生匹配 (章节索引, 章内字节偏移, 预览)，每章结束时产生None以便检查时间片
+        
+        字节偏移随匹配逐段累加，分页直接使用ChapterStore的页边界。
+        """
         for i, chapter in enumerate(self.chapters):
-            if keyword.lower() in chapter.lower():
-                # 找到所有匹配位置
-                start = 0
-                while True:
-                    pos = chapter.lower().find(keyword.lower(), start)
-                    if pos == -1:
-                        break
-                    
-                    preview = chapter[max(0, pos-20):pos+50].replace('\n', ' ')
-                    self.search_results.append((i, pos, preview))
-                    start = pos + 1
+            lowered = chapter.lower()
+            char_pos = byte_pos = 0
+            pos = lowered.find(keyword)
+            while pos != -1:
+                byte_pos += len(chapter[char_pos:pos].encode('utf-8'))
+                char_pos = pos
+                preview = chapter[max(0, pos-20):pos+50].replace('\n', ' ')
+                yield i, byte_pos, preview
+                pos = lowered.find(keyword, pos + 1)
+            yield None
+    
+    def search_batch(self, token):
+        """处理一批匹配，超出时间片后让出主线程，下一批由after调度"""
+        self.search_job = None
+        if token != self.search_token:
+            return
         
+        deadline = time.perf_counter() + SEARCH_BATCH_SECONDS
+        for match in self.search_matches:
+            if match is not None:
+                chap_idx, pos, preview = match
+                page = self.chapters.page_for_offset(chap_idx, pos)
+                self.result_tree.insert(
+                    '', tk.END,
+                    iid=str(len(self.search_results)),
+                    values=(f"第{chap_idx+1}章 第{page+1}页", f"...{preview}...")
+                )
+                self.search_results.append((chap_idx, pos, preview))
+            
+            if time.perf_counter() >= deadline:
+                self.result_status.config(text=f"搜索中... 已找到{len(self.search_results)}条")
+                self.search_job = self.root.after(1, self.search_batch, token)
+                return
+        
+        self.search_matches = None
+        self.perf.record('search', time.perf_counter() - self.search_started,
+                         keyword=self.search_keyword, results=len(self.search_results))
         if not self.search_results:
+            self.result_window.destroy()
             messagebox.showinfo("提示", "没有找到匹配内容")
             return
-            
-        self.show_search_results()
+        self.result_status.config(text=f"共找到{len(self.search_results)}条")
     
     def show_search_results(self):
-        """显示搜索结果"""
+        """显示搜索结果窗口（重复搜索时复用并清空）"""
+        if self.result_window is not None and self.result_window.winfo_exists():
+            self.result_tree.delete(*self.result_tree.get_children())
+            self.result_status.config(text="搜索中...")
+            self.result_window.lift()
+            return
+        
         result_window = tk.Toplevel(self.root)
         result_window.title("搜索结果")
         result_window.geometry("600x400")
+        self.result_window = result_window
+        
+        self.result_status = ttk.Label(result_window, text="搜索中...")
+        self.result_status.pack(fill=tk.X, padx=5, pady=5)
         
         # 搜索结果列表
-        tree = ttk.Treeview(result_window, columns=('preview'), show='headings')
-        tree.heading('#0', text='位置')
+        tree = ttk.Treeview(result_window, columns=('location', 'preview'), show='headings')
+        tree.heading('location', text='位置')
         tree.heading('preview', text='内容预览')
-        tree.column('#0', width=100)
-        tree.column('preview', width=480)
-        
-        for i, (chap_idx, pos, preview) in enumerate(self.search_results):
-            tree.insert('', tk.END, text=f"第{chap_idx+1}章", values=(f"...{preview}...",))
-        
+        tree.column('location', width=120)
+        tree.column('preview', width=460)
         tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.result_tree = tree
+        
+        def close():
+            self.cancel_search()
+            result_window.destroy()
         
-        # 跳转按钮
+        # 跳转到匹配所在页
         def goto_result():
             selection = tree.selection()
             if selection:
-                idx = tree.index(selection[0])
-                chap_idx = self.search_results[idx][0]
+                chap_idx, pos, _ = self.search_results[int(selection[0])]
+                close()
                 self.current_chapter = chap_idx
-                self.current_page = 0
+                self.current_page = self.chapters.page_for_offset(chap_idx, pos)
                 self.display_chapter()
-                result_window.destroy()
+        
+        tree.bind('<Double-Button-1>', lambda e: goto_result())
+        result_window.protocol("WM_DELETE_WINDOW", close)
         
         btn_frame = ttk.Frame(result_window)
         btn_frame.pack(fill=tk.X, padx=5, pady=5)
         
         ttk.Button(btn_frame, text="跳转", command=goto_result).pack(side=tk.LEFT)
-        ttk.Button(btn_frame, text="关闭", command=result_window.destroy).pack(side=tk.RIGHT)
+        ttk.Button(btn_frame, text="关闭", command=close).pack(side=tk.RIGHT)
     
     def show_settings(self):
         """显示设置对话框"""
@@ -522,7 +1594,16 @@ class ModernEPubReader:
         ttk.Button(btn_frame, text="取消", command=dialog.destroy).pack(side=tk.LEFT)
     
     def get_available_fonts(self):
-        """获取系统可用字体列表"""
+        """获取系统可用字体列表（跨会话缓存，系统字体目录变化时重新枚举）"""
+        if self.available_fonts is None:
+            self.available_fonts = load_font_cache()
+            if self.available_fonts is None:
+                self.available_fonts = self.enumerate_fonts()
+                save_font_cache(self.available_fonts)
+        return self.available_fonts
+    
+    def enumerate_fonts(self):
+        """枚举系统字体，首选字体排在前面"""
         fonts = list(font.families())
         preferred_fonts = [
             "Microsoft YaHei", 
@@ -544,7 +1625,114 @@ class ModernEPubReader:
         
         return available_fonts + sorted(fonts)
 
+
+SYNTHETIC_PARAGRAPH = "这是一段用于性能测试的中文文本，The quick brown fox jumps over the lazy dog。" * 3
+SYNTHETIC_KEYWORD = "针尖"  # 每100段出现一次，用于搜索测试
+
+
+def write_synthetic_epub(path, size_mb, chapters=10, nested=False):
+    """生成正文约size_mb MB的测试EPUB，nested为True时每10段包在两层div中"""
+    paragraphs = max(1, int(size_mb * 1048576 / chapters / len(SYNTHETIC_PARAGRAPH.encode('utf-8'))))
+    lines = [
+        f"<p>{SYNTHETIC_KEYWORD if i % 100 == 0 else ''}{SYNTHETIC_PARAGRAPH}</p>"
+        for i in range(paragraphs)
+    ]
+    if nested:
+        lines = [
+            '<div class="section"><div class="block">' + ''.join(lines[i:i+10]) + '</div></div>'
+            for i in range(0, len(lines), 10)
+        ]
+    body = '\n'.join(lines)
+    
+    manifest, spine = [], []
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        zf.writestr('META-INF/container.xml', (
+            '<?xml version="1.0"?>'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ))
+        for c in range(chapters):
+            name = f'chapter{c}.xhtml'
+            zf.writestr(f'OEBPS/{name}', (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>synthetic</title></head>'
+                f'<body><h1>第{c+1}章</h1>\n{body}</body></html>'
+            ))
+            manifest.append(f'<item id="c{c}" href="{name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="c{c}"/>')
+        zf.writestr('OEBPS/toc.ncx', (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            '<head><meta name="dtb:uid" content="synthetic"/></head>'
+            '<docTitle><text>synthetic</text></docTitle><navMap>'
+            '<navPoint id="n0" playOrder="1"><navLabel><text>第1章</text></navLabel>'
+            '<content src="chapter0.xhtml"/></navPoint></navMap></ncx>'
+        ))
+        zf.writestr('OEBPS/content.opf', (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="2.0" unique-identifier="uid">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:title>synthetic {size_mb}MB</dc:title><dc:identifier id="uid">synthetic</dc:identifier>'
+            '<dc:language>zh</dc:language></metadata>'
+            '<manifest><item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>'
+            f'{"".join(manifest)}</manifest><spine toc="ncx">{"".join(spine)}</spine></package>'
+        ))
+
+
+def run_benchmark(sizes_mb=(1, 4, 16), page_turns=20):
+    """无交互基准：用逐步增大的合成EPUB驱动阅读器，输出各阶段耗时和内存
+    
+    主窗口隐藏，但Tk仍需要显示环境（无桌面时可使用Xvfb）。
+    """
+    print(f"{'大小':>8} {'解析ms':>9} {'分页ms':>8} {'渲染ms':>8} {'搜索ms':>9} {'结果数':>7} {'缓冲MB':>8} {'峰值内存MB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 使用临时书库，不触碰用户目录下的library.db
+        root = tk.Tk()
+        root.withdraw()
+        app = ModernEPubReader(root, library=Library(os.path.join(tmp, 'library.db')))
+        try:
+            for size in sizes_mb:
+                path = os.path.join(tmp, f'synthetic_{size}MB.epub')
+                write_synthetic_epub(path, size)
+                app.perf.reset()
+                
+                app.load_epub(path)
+                app.display_chapter()
+                for _ in range(page_turns):
+                    last_chapter = app.current_chapter == len(app.chapters) - 1
+                    if last_chapter and app.current_page >= app.chapters.page_count(app.current_chapter) - 1:
+                        break
+                    app.next_page()
+                
+                app.search_entry.delete(0, tk.END)
+                app.search_entry.insert(0, SYNTHETIC_KEYWORD)
+                app.do_search()
+                while app.search_matches is not None:
+                    root.update()
+                results = len(app.search_results)
+                app.close_search_results()
+                
+                rss = peak_rss_kb()
+                print(f"{size:>6g}MB {app.perf.last['parse']:9.1f} {app.perf.average('paginate'):8.2f} "
+                      f"{app.perf.average('render'):8.2f} {app.perf.last['search']:9.1f} {results:7d} "
+                      f"{app.chapters.nbytes / 1048576:8.1f} {rss / 1024 if rss is not None else float('nan'):10.1f}")
+        finally:
+            app.library.close()
+            root.destroy()
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench-extract':
+        benchmark_extraction(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        run_benchmark([float(size) for size in sys.argv[2:]] or (1, 4, 16))
+        sys.exit(0)
+    
     root = tk.Tk()
     app = ModernEPubReader(root)
+    if '--perf' in sys.argv[1:]:
+        app.toggle_perf()
     root.mainloop()
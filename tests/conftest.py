@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+import pytest
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'epub阅读器.py')
+
+
+@pytest.fixture(scope='session')
+def reader():
+    """按路径加载阅读器模块（文件名不是合法的模块名）"""
+    pytest.importorskip('ttkbootstrap')
+    spec = importlib.util.spec_from_file_location('epub_reader', MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,57 @@
+import pytest
+
+
+def make_chapter(lines, multibyte=False):
+    word = '中文é段落' if multibyte else 'line'
+    return '\n'.join(f'{word}{i}' for i in range(lines))
+
+
+def baseline_pages(text):
+    """原先的分页方式：按行切分，每页50行"""
+    lines = text.split('\n')
+    total_pages = (len(lines) // 50) + 1
+    return ['\n'.join(lines[p*50:p*50+50]) for p in range(total_pages)]
+
+
+@pytest.fixture
+def store(reader):
+    store = reader.ChapterStore()
+    for lines in (49, 50, 51, 100):
+        store.append(make_chapter(lines))
+        store.append(make_chapter(lines, multibyte=True))
+    store.append('')
+    return store
+
+
+def test_page_text_matches_baseline(store):
+    for i, text in enumerate(store):
+        pages = baseline_pages(text)
+        assert store.page_count(i) == len(pages)
+        assert [store.page_text(i, p) for p in range(len(pages))] == pages
+        assert store.page_text(i, len(pages)) == ''
+
+
+def test_page_for_offset_matches_line_count(store):
+    for i, text in enumerate(store):
+        for char_pos in range(0, len(text), 7):
+            byte_pos = len(text[:char_pos].encode('utf-8'))
+            assert store.page_for_offset(i, byte_pos) == text[:char_pos].count('\n') // 50
+
+
+def test_page_boundaries(store):
+    # 第6、7章为100行：第50行（下标）是第二页首行
+    text = store[6]
+    start = text.index('line50')
+    byte_pos = len(text[:start].encode('utf-8'))
+    assert store.page_for_offset(6, byte_pos - 1) == 0
+    assert store.page_for_offset(6, byte_pos) == 1
+    assert store.page_text(6, 1).startswith('line50')
+
+
+def test_lines_text_matches_split(store):
+    for i, text in enumerate(store):
+        lines = text.split('\n')
+        for start in range(0, len(lines) + 2, 13):
+            for end in (start, start + 1, start + 37, len(lines) + 5):
+                expected = '\n'.join(lines[start:end]) if start < len(lines) else ''
+                assert store.lines_text(i, start, end) == expected
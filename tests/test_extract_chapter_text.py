@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip('lxml')
+
+
+def extract_both(reader, content):
+    reader.import_parsing_stack()
+    return (reader.extract_chapter_text(content, 'lxml'),
+            reader.extract_chapter_text(content, 'html.parser'))
+
+
+@pytest.mark.parametrize('html, expected', [
+    ('<div>intro<div><p>a <i>b</i></p><p>c</p></div>tail</div>', 'intro\na b\nc\ntail'),
+    ('<p>a<div>b</div>c</p>', 'a\nb'),
+    ('<h1>Title<p>para</p>', '\n【Title】\n\npara'),
+    ('<h1>T<div>x</div></h1>', '\n【T】\n\nx'),
+    ('<div>x<p>a<p>b</div>z', 'x\na\nb'),
+    ('<p>a<span>b<div>c</div>d</span>e</p>', 'ab\nc\nde'),
+    ('<nav><p>x</p></nav><p>a<br/>b</p><script>bad()</script><div/>', 'ab'),
+])
+def test_parsers_agree(reader, html, expected):
+    assert extract_both(reader, html.encode('utf-8')) == (expected, expected)
+
+
+@pytest.mark.parametrize('html', [
+    '<?xml version="1.0" encoding="gbk"?><html><body><p>中文</p></body></html>',
+    '<html><head><meta charset="gbk"/></head><body><p>中文</p></body></html>',
+    '<html><head><meta http-equiv="Content-Type" content="text/html; charset=gb2312"/></head>'
+    '<body><p>中文</p></body></html>',
+])
+def test_declared_encoding(reader, html):
+    assert extract_both(reader, html.encode('gbk')) == ('中文', '中文')
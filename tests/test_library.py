@@ -0,0 +1,89 @@
+import os
+import shutil
+import zipfile
+
+import pytest
+
+
+@pytest.fixture
+def library(reader, tmp_path):
+    lib = reader.Library(str(tmp_path / 'db' / 'library.db'))
+    yield lib
+    lib.close()
+
+
+@pytest.fixture
+def folder(reader, tmp_path):
+    books = tmp_path / 'books'
+    books.mkdir()
+    for i in range(3):
+        reader.write_synthetic_epub(str(books / f'book{i}.epub'), 0.01)
+    return str(books)
+
+
+def write_deflate64_epub(path):
+    """把条目的压缩方式改为deflate64（zipfile可以列出但无法读取）"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('META-INF/container.xml', '<container/>')
+    data = bytearray(open(path, 'rb').read())
+    for signature, offset in ((b'PK\x03\x04', 8), (b'PK\x01\x02', 10)):
+        pos = data.find(signature)
+        data[pos+offset:pos+offset+2] = (9).to_bytes(2, 'little')
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_rescan_is_noop(library, folder):
+    library.add_folder(folder)
+    assert library.scan(library.folders()) == (3, 0)
+    assert library.scan(library.folders()) == (0, 0)
+
+
+def test_changed_file_is_reread_and_keeps_position(reader, library, folder):
+    library.add_folder(folder)
+    library.scan(library.folders())
+    path = os.path.join(folder, 'book1.epub')
+    library.save_position(path, 2, 5)
+    
+    reader.write_synthetic_epub(path, 0.02)
+    os.utime(path, (1, 1))
+    assert library.scan(library.folders()) == (1, 0)
+    assert library.get_position(path) == (2, 5)
+
+
+def test_deleted_file_is_removed_but_bookmarks_kept(library, folder):
+    library.add_folder(folder)
+    library.scan(library.folders())
+    path = os.path.join(folder, 'book0.epub')
+    library.set_bookmark(path, 'mark', 1, 1)
+    
+    os.remove(path)
+    assert library.scan(library.folders()) == (0, 1)
+    assert path not in [row[0] for row in library.books()]
+    assert library.get_bookmarks(path) == {'mark': (1, 1)}
+
+
+def test_missing_folder_is_left_alone(library, folder):
+    library.add_folder(folder)
+    library.scan(library.folders())
+    path = os.path.join(folder, 'book2.epub')
+    library.save_position(path, 3, 4)
+    library.set_bookmark(path, 'mark', 3, 4)
+    
+    shutil.move(folder, folder + '_unmounted')
+    assert library.scan(library.folders()) == (0, 0)
+    assert len(library.books()) == 3
+    assert library.get_position(path) == (3, 4)
+    assert library.get_bookmarks(path) == {'mark': (3, 4)}
+
+
+def test_unreadable_file_does_not_abort_scan(reader, library, folder):
+    bad = os.path.join(folder, 'deflate64.epub')
+    write_deflate64_epub(bad)
+    with zipfile.ZipFile(bad) as zf, pytest.raises(NotImplementedError):
+        zf.read('META-INF/container.xml')
+    
+    library.add_folder(folder)
+    assert library.scan(library.folders()) == (4, 0)
+    titles = {path: title for path, title, _, _ in library.books()}
+    assert titles[bad] == 'deflate64'